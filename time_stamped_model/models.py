@@ -1,10 +1,26 @@
+import contextlib
+import contextvars
+import re
 import uuid
 
-from django.db.models import DateTimeField, Model, Max
+from django.db import transaction
+from django.db.models import DateTimeField, F, Model
 from django.utils.text import slugify
 
 __author__ = 'Tom'
 
+# Translation table for allow_dashes=False; a single C-level pass with no search phase.
+_DASH_TO_UNDERSCORE = str.maketrans('-', '_')
+
+# Names that are ASCII words separated by single spaces slugify to lower() with the
+# spaces dashed; matching them up front skips slugify's unicode normalisation and
+# regex substitutions on the common case.
+_SIMPLE_SLUG_SOURCE_RE = re.compile(r'[A-Za-z0-9]+(?: [A-Za-z0-9]+)*')
+
+# Per-thread/async-context cache of prefetched slug sets, populated by
+# TimeStampedModel.slug_allocation_scope and consulted by make_new_slug.
+_slug_scope_cache = contextvars.ContextVar('_slug_scope_cache', default=None)
+
 
 class CreationDateTimeField(DateTimeField):
     """
@@ -13,6 +29,9 @@ class CreationDateTimeField(DateTimeField):
     """
 
     def __init__(self, *args, **kwargs):
+        # With no user overrides the deconstructed form is fully known up front,
+        # so deconstruct() can skip the super() option walk entirely.
+        self._defaults_intact = not args and not kwargs
         kwargs.setdefault('editable', False)
         kwargs.setdefault('blank', False)
         kwargs.setdefault('auto_now_add', True)
@@ -22,6 +41,14 @@ class CreationDateTimeField(DateTimeField):
         return "DateTimeField"
 
     def deconstruct(self):
+        if self.__dict__.get('_defaults_intact') and type(self) is CreationDateTimeField:
+            return self.name, 'time_stamped_model.models.CreationDateTimeField', [], {'auto_now_add': True}
+        # Field options are immutable after __init__ and migration autodetection calls
+        # deconstruct() once per model state, so cache the result (keyed on name in
+        # case the field is rebound) and hand back fresh copies.
+        cached = self.__dict__.get('_deconstructed')
+        if cached is not None and cached[0] == self.name:
+            return cached[0], cached[1], list(cached[2]), dict(cached[3])
         name, path, args, kwargs = super().deconstruct()
         if self.editable is not False:
             kwargs['editable'] = True
@@ -29,10 +56,13 @@ class CreationDateTimeField(DateTimeField):
             kwargs['blank'] = False
         if self.auto_now_add is not False:
             kwargs['auto_now_add'] = True
+        self._deconstructed = (name, path, tuple(args), dict(kwargs))
         return name, path, args, kwargs
 
     def pre_save(self, model_instance, add):
-        if not getattr(model_instance, 'update_created', True):
+        # The flag is only ever set False as an instance attribute (set_created_date),
+        # so a plain __dict__ lookup avoids walking the class MRO on every save.
+        if not model_instance.__dict__.get('update_created', True):
             field_data = getattr(model_instance, self.attname)
             if field_data is not None:
                 return field_data
@@ -47,6 +77,7 @@ class ModificationDateTimeField(CreationDateTimeField):
     """
 
     def __init__(self, *args, **kwargs):
+        self._defaults_intact = not args and not kwargs
         kwargs.setdefault('auto_now', True)
         DateTimeField.__init__(self, *args, **kwargs)
 
@@ -54,13 +85,20 @@ class ModificationDateTimeField(CreationDateTimeField):
         return "DateTimeField"
 
     def deconstruct(self):
+        if self.__dict__.get('_defaults_intact') and type(self) is ModificationDateTimeField:
+            return self.name, 'time_stamped_model.models.ModificationDateTimeField', [], {'auto_now': True}
+        cached = self.__dict__.get('_deconstructed')
+        if cached is not None and cached[0] == self.name:
+            return cached[0], cached[1], list(cached[2]), dict(cached[3])
         name, path, args, kwargs = super().deconstruct()
         if self.auto_now is not False:
             kwargs['auto_now'] = True
+        # Overwrites the entry cached by the parent deconstruct for this field.
+        self._deconstructed = (name, path, tuple(args), dict(kwargs))
         return name, path, args, kwargs
 
     def pre_save(self, model_instance, add):
-        if not getattr(model_instance, 'update_modified', True):
+        if not model_instance.__dict__.get('update_modified', True):
             field_data = getattr(model_instance, self.attname)
             if field_data is not None:
                 return field_data
@@ -77,6 +115,16 @@ class TimeStampedModel(Model):
     created = CreationDateTimeField()
     modified = ModificationDateTimeField()
 
+    # Class-level defaults; set_created_date/set_modified_date shadow these with
+    # instance attributes, so hydrating rows from the database writes nothing.
+    update_created = True
+    update_modified = True
+
+    # Once a base name has more than this many numeric suffixes in use, slug
+    # allocation stops searching for a gap and appends a short uuid instead.
+    # Set to None on a subclass to always search. See _first_free_slug.
+    slug_max_probes = 16
+
     class Meta:
         abstract = True
 
@@ -124,67 +172,179 @@ class TimeStampedModel(Model):
         if extra_filters is None:
             extra_filters = {}
 
-        if exclude_list is None:
-            exclude_list = []
+        # Coerced once so membership checks and the merge below are O(1) per slug.
+        exclude_set = frozenset() if exclude_list is None else frozenset(exclude_list)
 
         if name is None:
             name = getattr(self, 'name', '')  # Fallback to an empty string if 'name' attribute doesn't exist
 
         current_slug = getattr(self, slug_field_name, '')
+        slug_is_blank = current_slug is None or current_slug == ''
+
+        if not self.pk and slug_is_blank:
+            on_edit_of_existing = False
+        elif self.pk and (on_edit or (on_blank and slug_is_blank)):
+            on_edit_of_existing = True
+        else:
+            return
+
+        main_slug = self._build_main_slug(name, allow_dashes, max_length)
+
+        scope_cache = _slug_scope_cache.get()
+        scoped_slugs = None
+        if scope_cache is not None:
+            scoped_slugs = scope_cache.get(self._slug_scope_key(obj, extra_filters, slug_field_name))
+
+        if scoped_slugs is not None:
+            # Inside a slug_allocation_scope the slug set was prefetched once for the
+            # whole batch; resolve against it without touching the database.
+            taken = {taken_slug for taken_slug in scoped_slugs if taken_slug.startswith(main_slug)}
+            if on_edit_of_existing:
+                taken.discard(current_slug)
+        else:
+            # One query fetches every slug sharing the prefix; the free suffix is then found in memory
+            # instead of issuing an exists() round trip per candidate.
+            base_queryset = obj.objects.filter(**extra_filters)
+            if on_edit_of_existing:
+                base_queryset = base_queryset.exclude(pk=self.pk)
+            taken_queryset = base_queryset.filter(**{f'{slug_field_name}__startswith': main_slug})
+            # order_by() strips any Meta.ordering; the rows land in a set, so sorting
+            # them in the database is wasted work.
+            taken = set(taken_queryset.order_by().values_list(slug_field_name, flat=True))
+        taken |= exclude_set
+
+        slug = self._first_free_slug(main_slug, taken, allow_dashes, max_length)
+        if scoped_slugs is not None:
+            scoped_slugs.add(slug)
+        setattr(self, slug_field_name, slug)
+
+    @staticmethod
+    def _slug_scope_key(model_cls, extra_filters, slug_field_name):
+        return model_cls, slug_field_name, tuple(sorted(extra_filters.items()))
+
+    @classmethod
+    @contextlib.contextmanager
+    def slug_allocation_scope(cls, extra_filters=None, slug_field_name='slug'):
+        """
+        Prefetches the slug set once so every make_new_slug call inside the block resolves in memory.
 
-        if not self.pk and (current_slug is None or current_slug == ''):
-            main_slug = slugify(name)[:max_length]
-
-            if main_slug == '':
-                main_slug = str(uuid.uuid4())
-            if not allow_dashes:
-                main_slug = main_slug.replace('-', '_')
-            slug = main_slug
-            count = 1
-
-            # This loop checks for existence in the database considering extra_filters
-            while obj.objects.filter(**{slug_field_name: slug}, **extra_filters).exists() or slug in exclude_list:
-                slug = f'{main_slug}{count}'
-                if not allow_dashes:
-                    slug = slug.replace('-', '_')
-                count += 1
-
-                # Check and increment if slug is in exclude_list
-                while slug in exclude_list:
-                    slug = f'{main_slug}{count}'
-                    count += 1
+        When importing many siblings that share the same extra_filters scope, each save re-queries the same
+        slugs. Inside this context manager the set is fetched once on entry; make_new_slug then allocates
+        against it (adding each chosen slug so the batch cannot collide with itself) without further queries.
 
-                # After adjusting for exclude_list, re-check for unique slug avoiding infinite loop
-                if not obj.objects.filter(**{slug_field_name: slug}, **extra_filters).exists():
-                    break
+        Parameters:
+        - extra_filters (dict, optional): This allows for unique together; must match the extra_filters passed
+          to make_new_slug inside the block.
+        - slug_field_name (str): The name of the slug field on the model.
 
-            setattr(self, slug_field_name, slug)
+        Usage:
+          with MyModel.slug_allocation_scope(extra_filters={'base': base}):
+              for row in rows:
+                  MyModel(name=row['name'], base=base).save()
 
-        elif self.pk and (on_edit or (on_blank and (current_slug is None or current_slug == ''))):
+        The cache is local to the current thread/async context. Do not create instances from other scopes
+        (or other processes) inside the block, as their slugs will not be seen.
+        """
+        if extra_filters is None:
+            extra_filters = {}
+        key = cls._slug_scope_key(cls, extra_filters, slug_field_name)
+        cache = _slug_scope_cache.get()
+        token = None
+        if cache is None:
+            cache = {}
+            token = _slug_scope_cache.set(cache)
+        # NULL slugs (rows waiting for an on_blank fill) can never collide and would
+        # break the startswith checks in make_new_slug, so keep them out of the set.
+        cache[key] = set(cls.objects.filter(**extra_filters)
+                         .exclude(**{f'{slug_field_name}__isnull': True})
+                         .order_by().values_list(slug_field_name, flat=True))
+        try:
+            yield
+        finally:
+            if token is not None:
+                _slug_scope_cache.reset(token)
+            else:
+                cache.pop(key, None)
+
+    @staticmethod
+    def _build_main_slug(name, allow_dashes=True, max_length=45):
+        stripped = name.strip() if isinstance(name, str) else None
+        if stripped is not None and _SIMPLE_SLUG_SOURCE_RE.fullmatch(stripped) is not None:
+            main_slug = stripped.lower().replace(' ', '-')[:max_length]
+        else:
             main_slug = slugify(name)[:max_length]
-            if not allow_dashes:
-                main_slug = main_slug.replace('-', '_')
-            slug = main_slug
-            count = 1
-
-            # Similar check for when on_edit or on_blank conditions are met
-            while obj.objects.filter(**{slug_field_name: slug}, **extra_filters).exclude(
-                    pk=self.pk).exists() or slug in exclude_list:
-                slug = f'{main_slug}{count}'
-                if not allow_dashes:
-                    slug = slug.replace('-', '_')
+        if main_slug == '':
+            # uuid hex is already slug safe and contains no dashes
+            return uuid.uuid4().hex[:max_length]
+        if not allow_dashes:
+            main_slug = main_slug.translate(_DASH_TO_UNDERSCORE)
+        return main_slug
+
+    @classmethod
+    def _first_free_slug(cls, main_slug, taken, allow_dashes=True, max_length=45):
+        # The numeric suffix can never introduce a dash, so the dash handling done
+        # on main_slug covers every candidate.
+        if main_slug not in taken:
+            return main_slug
+        # Walk the sorted numeric suffixes already in use and take the first gap,
+        # instead of formatting and hashing one candidate string per collision.
+        prefix_length = len(main_slug)
+        # Callers may hand over unfiltered slug sets; skip NULL/empty entries.
+        suffixes = sorted(int(slug[prefix_length:]) for slug in taken
+                          if slug and slug.startswith(main_slug) and slug[prefix_length:].isdecimal())
+        if cls.slug_max_probes is not None and len(suffixes) > cls.slug_max_probes:
+            # Heavily contended base name; a short uuid suffix is collision free in
+            # one try with overwhelming probability, so skip the gap search and keep
+            # the worst case bounded. The unique constraint on the slug field
+            # backstops the astronomically unlikely hex clash.
+            separator = '-' if allow_dashes else '_'
+            while True:
+                slug = f'{main_slug[:max_length - 9]}{separator}{uuid.uuid4().hex[:8]}'
+                if slug not in taken:
+                    return slug
+        count = 1
+        for suffix in suffixes:
+            if suffix == count:
                 count += 1
+            elif suffix > count:
+                break
+        return f'{main_slug}{count}'
 
-                # Again, check and increment if slug is in exclude_list
-                while slug in exclude_list:
-                    slug = f'{main_slug}{count}'
-                    count += 1
+    @classmethod
+    def allocate_unique_slug(cls, name, extra_filters=None, allow_dashes=True, slug_field_name='slug',
+                             max_length=45):
+        """
+        Returns a free slug for name, locking the competing rows so concurrent workers cannot pick it too.
 
-                # Check for unique slug after adjustments
-                if not obj.objects.filter(**{slug_field_name: slug}, **extra_filters).exclude(pk=self.pk).exists():
-                    break
+        make_new_slug reads the taken slugs without locking, so two workers importing the same name can both
+        see it free and collide on the unique constraint at insert time. This fetches the slugs sharing the
+        prefix with select_for_update inside a transaction and resolves the suffix locally - one locked query
+        per allocation.
 
-            setattr(self, slug_field_name, slug)
+        Parameters:
+        - name (str): The value to make the slug from.
+        - extra_filters (dict, optional): This allows for unique together, as in make_new_slug.
+        - allow_dashes (bool): Whether dashes are allowed in the slug.
+        - slug_field_name (str): The name of the slug field on the model.
+        - max_length (int): Maximum slug length before any numeric suffix.
+
+        Call this (and the save that uses the returned slug) inside one transaction.atomic() block; the row
+        locks are only held until that transaction commits. On backends without SELECT FOR UPDATE, keep
+        unique=True on the slug field and retry on IntegrityError instead.
+
+        Usage:
+          with transaction.atomic():
+              instance.slug = MyModel.allocate_unique_slug(instance.name)
+              instance.save()
+        """
+        if extra_filters is None:
+            extra_filters = {}
+        main_slug = cls._build_main_slug(name, allow_dashes, max_length)
+        with transaction.atomic():
+            taken_queryset = cls.objects.select_for_update().filter(
+                **{f'{slug_field_name}__startswith': main_slug}, **extra_filters)
+            taken = set(taken_queryset.order_by().values_list(slug_field_name, flat=True))
+            return cls._first_free_slug(main_slug, taken, allow_dashes, max_length)
 
     def set_order_field(self, obj=None, extra_filters=None, order_field='order'):
         """
@@ -211,6 +371,10 @@ class TimeStampedModel(Model):
 
         This method calculates the next available order number by finding the maximum value of the order
         field and incrementing it. If no records are found, it starts from 1.
+
+        When saving many instances in one go, use allocate_orders (or bulk_create_with_hooks) instead, which
+        runs the aggregate once for the whole batch rather than once per save. Adding db_index=True to the
+        order field lets the database resolve the maximum from the index instead of scanning the table.
         """
 
         if obj is None:
@@ -219,13 +383,50 @@ class TimeStampedModel(Model):
         if order is None:
             if extra_filters is None:
                 extra_filters = {}
-            order = obj.objects.filter(**extra_filters).aggregate(Max(order_field))[f'{order_field}__max']
+            order = obj.objects.filter(**extra_filters).order_by(
+                F(order_field).desc(nulls_last=True)).values_list(order_field, flat=True).first()
             if order is None:
                 order = 1
             else:
                 order += 1
             setattr(self, order_field, order)
 
+    @classmethod
+    def allocate_orders(cls, objs, extra_filters=None, order_field='order'):
+        """
+        Assigns sequential order numbers to a batch of unsaved instances with a single aggregate query.
+
+        set_order_field issues a SELECT MAX(order) per save; for N inserts that is N round trips over the
+        same rows. This runs the aggregate once, then hands out consecutive numbers locally. Instances whose
+        order field is already set are left alone and do not consume a number.
+
+        Parameters:
+        - objs (list): Model instances to number.
+        - extra_filters (dict, optional): Additional filters to apply when determining the order, as in
+          set_order_field. All instances in the batch must belong to the same filter scope.
+        - order_field (str): The field used to determine the order. Default is 'order'.
+        """
+        if extra_filters is None:
+            extra_filters = {}
+        max_order = cls.objects.filter(**extra_filters).order_by(
+            F(order_field).desc(nulls_last=True)).values_list(order_field, flat=True).first()
+        next_order = (max_order or 0) + 1
+        for instance in objs:
+            if getattr(instance, order_field) is None:
+                setattr(instance, order_field, next_order)
+                next_order += 1
+
+    @classmethod
+    def _instance_type_value(cls):
+        # The model name part of 'app_label.model_name'; invariant per class, so split
+        # once and keep it on the class. Computed lazily because __init_subclass__
+        # runs before Django's metaclass has attached _meta.
+        value = cls.__dict__.get('_instance_type_cache')
+        if value is None:
+            value = cls._meta.label_lower.split('.', 1)[1]
+            cls._instance_type_cache = value
+        return value
+
     def set_instance_type(self, instance_type_field='instance_type', allow_multiple=False):
         """
         Sets the type of an instance for a Django model.
@@ -256,14 +457,77 @@ class TimeStampedModel(Model):
         - In a case where there is an abstract model 'Animal' and a subclass 'Dog',
           calling 'self.set_instance_type()' in Dog's save method would set 'instance_type' to 'dog'.
         """
-        instance_type = getattr(self, instance_type_field)
+        instance_type = getattr(self, instance_type_field, None)
 
         if instance_type is None:
-            instance_type = self._meta.label_lower.split('.')[1]
-            setattr(self, instance_type_field, instance_type)
+            setattr(self, instance_type_field, self._instance_type_value())
         elif allow_multiple:
             instance_types = instance_type.split(';')
-            current_instance_type = self._meta.label_lower.split('.')[1]
+            current_instance_type = self._instance_type_value()
             if current_instance_type not in instance_types:
                 instance_types.append(current_instance_type)
                 setattr(self, instance_type_field, ';'.join(instance_types))
+
+    @classmethod
+    def bulk_create_with_hooks(cls, objs, batch_size=1000, name_field='name', allow_dashes=True, extra_filters=None,
+                               slug_field_name='slug', order_field='order', instance_type_field='instance_type',
+                               max_length=45):
+        """
+        Creates many instances with the slug, order and instance type hooks applied, using a fixed number of
+        queries instead of one set of queries per row.
+
+        Calling save() in a loop runs make_new_slug / set_order_field / set_instance_type once per instance, each
+        hitting the database. This method prefetches the existing slugs and the current maximum order once, resolves
+        everything locally (new slugs are added to the in-memory set so the batch cannot collide with itself), and
+        inserts with a single bulk_create.
+
+        Parameters:
+        - objs (list): Unsaved model instances to create.
+        - batch_size (int): Passed through to bulk_create. Default is 1000.
+        - name_field (str): The field to make the slug from. Default is 'name'.
+        - allow_dashes (bool): Whether dashes are allowed in the slug.
+        - extra_filters (dict, optional): This allows for unique together, as in make_new_slug/set_order_field.
+        - slug_field_name (str): The name of the slug field on the model.
+        - order_field (str): The field used to determine the order.
+        - instance_type_field (str): The field name that stores the instance type.
+        - max_length (int): Maximum slug length before any numeric suffix.
+
+        Only the hooks whose fields actually exist on the model are applied, so this works for models that use
+        any subset of the slug/order/instance type features.
+
+        Usage:
+          MyModel.bulk_create_with_hooks([MyModel(name=n) for n in names])
+        """
+        if extra_filters is None:
+            extra_filters = {}
+
+        field_names = {field.name for field in cls._meta.concrete_fields}
+        has_slug = slug_field_name in field_names
+        has_order = order_field in field_names
+        has_instance_type = instance_type_field in field_names
+
+        taken = set()
+        if has_slug:
+            # NULL slugs cannot collide; keep them out of the set so the suffix
+            # search only ever sees strings.
+            taken = set(cls.objects.filter(**extra_filters)
+                        .exclude(**{f'{slug_field_name}__isnull': True})
+                        .order_by().values_list(slug_field_name, flat=True))
+            # Slugs the caller set on the batch occupy their names too, otherwise an
+            # allocated slug could duplicate one of them inside the same insert.
+            taken.update(slug for slug in (getattr(instance, slug_field_name, None) for instance in objs) if slug)
+
+        if has_order:
+            cls.allocate_orders(objs, extra_filters=extra_filters, order_field=order_field)
+
+        for instance in objs:
+            if has_slug and not getattr(instance, slug_field_name, ''):
+                name = getattr(instance, name_field, '') or ''
+                main_slug = cls._build_main_slug(name, allow_dashes, max_length)
+                slug = cls._first_free_slug(main_slug, taken, allow_dashes, max_length)
+                taken.add(slug)
+                setattr(instance, slug_field_name, slug)
+            if has_instance_type:
+                instance.set_instance_type(instance_type_field=instance_type_field)
+
+        return cls.objects.bulk_create(objs, batch_size=batch_size)